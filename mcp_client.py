@@ -8,14 +8,14 @@ MCP 客户端
 
 import os
 import sys
-import json
-import time
 import uuid
+import asyncio
 import logging
-import requests
-import sseclient
-import threading
-from typing import Dict, Any, Optional, List, Union
+import orjson
+import msgspec
+import httpx
+from httpx_sse import aconnect_sse
+from typing import Dict, Any, Optional, List, Tuple, Union
 
 # 配置日志
 logging.basicConfig(
@@ -24,31 +24,46 @@ logging.basicConfig(
 )
 logger = logging.getLogger("mcp_client")
 
+# SSE 长连接的心跳间隔较长，不设置读取超时
+SSE_TIMEOUT = httpx.Timeout(10.0, read=None)
+
 class MCPClient:
-    """MCP 客户端类"""
+    """MCP 客户端类（异步）"""
     
-    def __init__(self, server_url: str = "http://127.0.0.1:12000"):
-        """初始化 MCP 客户端"""
+    def __init__(self, server_url: str = "http://127.0.0.1:12000", use_msgpack: bool = False):
+        """初始化 MCP 客户端
+        
+        use_msgpack 为 True 时使用 MessagePack 通道（/api/msgpack）发送请求
+        """
         self.server_url = server_url
+        self.use_msgpack = use_msgpack
         self.sse_url = f"{server_url}/sse"
         self.post_url = None  # 将由 SSE 连接提供
-        self.sse_thread = None
+        self.sse_task = None
         self.is_connected = False
+        self._connected_event = asyncio.Event()
+        
+        # 复用连接的 HTTP 客户端（keep-alive），SSE 与请求共享同一事件循环
+        self._client = httpx.AsyncClient(headers={
+            "Content-Type": "application/json",
+            "Accept": "application/json"
+        })
         
-    def connect(self):
+        # 待批量发送的请求队列
+        self._pending: List[Dict[str, Any]] = []
+    
+    async def connect(self):
         """连接到 MCP 服务器"""
         logger.info(f"连接到 MCP 服务器: {self.server_url}")
         
-        # 启动 SSE 连接线程
-        self.sse_thread = threading.Thread(target=self._sse_listener)
-        self.sse_thread.daemon = True
-        self.sse_thread.start()
+        # 启动 SSE 监听任务
+        self.sse_task = asyncio.create_task(self._sse_listener())
         
-        # 等待连接建立
-        timeout = 10
-        start_time = time.time()
-        while not self.is_connected and time.time() - start_time < timeout:
-            time.sleep(0.1)
+        # 等待连接建立（收到端点事件时唤醒）
+        try:
+            await asyncio.wait_for(self._connected_event.wait(), timeout=10)
+        except asyncio.TimeoutError:
+            pass
         
         if not self.is_connected:
             raise ConnectionError(f"无法连接到 MCP 服务器: {self.server_url}")
@@ -56,53 +71,77 @@ class MCPClient:
         logger.info(f"成功连接到 MCP 服务器，API 端点: {self.post_url}")
         
         # 发送初始化请求
-        return self.initialize()
+        return await self.initialize()
     
-    def _sse_listener(self):
+    async def _sse_listener(self):
         """SSE 连接监听器"""
         try:
-            headers = {"Accept": "text/event-stream"}
-            response = requests.get(self.sse_url, headers=headers, stream=True)
-            response.raise_for_status()
-            
-            client = sseclient.SSEClient(response)
-            for event in client.events():
-                if event.event == "endpoint":
-                    data = json.loads(event.data)
-                    self.post_url = data.get("uri")
-                    logger.info(f"收到端点 URI: {self.post_url}")
-                    self.is_connected = True
-                elif event.event == "heartbeat":
-                    logger.debug("收到心跳")
-                else:
-                    logger.info(f"收到事件: {event.event}, 数据: {event.data}")
+            async with aconnect_sse(self._client, "GET", self.sse_url, timeout=SSE_TIMEOUT) as event_source:
+                event_source.response.raise_for_status()
+                async for event in event_source.aiter_sse():
+                    self._handle_sse_event(event.event, event.data)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.exception(f"SSE 连接错误: {e}")
             self.is_connected = False
+            # 唤醒等待中的 connect()，避免等到超时
+            self._connected_event.set()
     
-    def send_request(self, method: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """发送 JSON-RPC 请求"""
-        if not self.is_connected or not self.post_url:
-            raise ConnectionError("未连接到 MCP 服务器")
-        
-        # 构建请求
-        request_id = str(uuid.uuid4())
+    def _handle_sse_event(self, event: str, data: str):
+        """处理 SSE 事件"""
+        if event == "endpoint":
+            self.post_url = orjson.loads(data).get("uri")
+            logger.info(f"收到端点 URI: {self.post_url}")
+            self.is_connected = True
+            self._connected_event.set()
+        elif event == "heartbeat":
+            logger.debug("收到心跳")
+        else:
+            logger.info(f"收到事件: {event}, 数据: {data}")
+    
+    def _build_request(self, method: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """构建 JSON-RPC 请求对象"""
         request_data = {
             "jsonrpc": "2.0",
-            "id": request_id,
+            "id": str(uuid.uuid4()),
             "method": method
         }
         if params:
             request_data["params"] = params
+        return request_data
+    
+    async def send_request(self, method: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """发送 JSON-RPC 请求"""
+        if not self.is_connected or not self.post_url:
+            raise ConnectionError("未连接到 MCP 服务器")
+        
+        # 构建请求
+        request_data = self._build_request(method, params)
         
         # 发送请求
         logger.info(f"发送请求: {method} 到 {self.post_url}")
         try:
-            response = requests.post(self.post_url, json=request_data)
+            if self.use_msgpack:
+                response = await self._client.post(
+                    f"{self.post_url.rstrip('/')}/msgpack",
+                    content=msgspec.msgpack.encode(request_data),
+                    headers={"Content-Type": "application/msgpack", "Accept": "application/msgpack"}
+                )
+            else:
+                response = await self._client.post(
+                    self.post_url, content=orjson.dumps(request_data), follow_redirects=True
+                )
             response.raise_for_status()
             
             # 解析响应
-            response_data = response.json()
+            if self.use_msgpack:
+                # 读取 4 字节大端长度前缀后解码帧内容
+                frame = memoryview(response.content)
+                length = int.from_bytes(frame[:4], "big")
+                response_data = msgspec.msgpack.decode(frame[4:4 + length])
+            else:
+                response_data = orjson.loads(response.content)
             
             # 检查是否有错误
             if "error" in response_data:
@@ -110,17 +149,57 @@ class MCPClient:
                 logger.error(f"请求错误: {error.get('message')}, 代码: {error.get('code')}")
             
             return response_data
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"请求失败: {e}")
-            if hasattr(e, 'response') and e.response:
+            if isinstance(e, httpx.HTTPStatusError):
                 logger.error(f"响应状态码: {e.response.status_code}")
-                try:
-                    logger.error(f"响应内容: {e.response.text}")
-                except:
-                    pass
+                logger.error(f"响应内容: {e.response.text}")
             raise
     
-    def initialize(self) -> Dict[str, Any]:
+    async def send_batch(self, calls: List[Tuple[str, Optional[Dict[str, Any]]]]) -> List[Optional[Dict[str, Any]]]:
+        """批量发送 JSON-RPC 请求
+        
+        所有请求合并为一个 JSON 数组，通过一次 HTTP 请求发送；
+        返回的响应按请求顺序排列
+        """
+        return await self._post_batch([self._build_request(method, params) for method, params in calls])
+    
+    def queue_request(self, method: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """将请求加入批量队列，返回请求 ID，调用 flush() 时统一发送"""
+        request_data = self._build_request(method, params)
+        self._pending.append(request_data)
+        return request_data["id"]
+    
+    async def flush(self) -> List[Optional[Dict[str, Any]]]:
+        """发送队列中所有待处理的请求"""
+        batch, self._pending = self._pending, []
+        if not batch:
+            return []
+        return await self._post_batch(batch)
+    
+    async def _post_batch(self, batch: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """发送批量请求（始终使用 JSON 通道）"""
+        if not self.is_connected or not self.post_url:
+            raise ConnectionError("未连接到 MCP 服务器")
+        
+        logger.info(f"发送批量请求: {len(batch)} 个请求到 {self.post_url}")
+        response = await self._client.post(self.post_url, content=orjson.dumps(batch), follow_redirects=True)
+        response.raise_for_status()
+        
+        # 解析响应（全部为通知时服务器返回空对象）
+        response_data = orjson.loads(response.content)
+        if not isinstance(response_data, list):
+            response_data = [response_data] if "error" in response_data else []
+        
+        # 服务器不保证响应顺序，按请求 ID 重新排列
+        responses = {item.get("id"): item for item in response_data}
+        for item in response_data:
+            if "error" in item:
+                error = item["error"]
+                logger.error(f"请求错误: {error.get('message')}, 代码: {error.get('code')}")
+        return [responses.get(request_data["id"]) for request_data in batch]
+    
+    async def initialize(self) -> Dict[str, Any]:
         """初始化 MCP 会话"""
         params = {
             "protocolVersion": "2024-11-05",
@@ -136,22 +215,37 @@ class MCPClient:
             }
         }
         
-        return self.send_request("initialize", params)
+        return await self.send_request("initialize", params)
     
-    def sample(self, prompt: str) -> Dict[str, Any]:
+    async def sample(self, prompt: str) -> Dict[str, Any]:
         """发送采样请求"""
         params = {
             "prompt": prompt
         }
         
-        return self.send_request("sample", params)
+        return await self.send_request("sample", params)
     
-    def shutdown(self) -> Dict[str, Any]:
+    async def shutdown(self) -> Dict[str, Any]:
         """关闭 MCP 会话"""
-        return self.send_request("shutdown", {})
+        try:
+            return await self.send_request("shutdown", {})
+        finally:
+            await self.close()
+    
+    async def close(self):
+        """停止 SSE 监听并关闭 HTTP 客户端"""
+        self.is_connected = False
+        if self.sse_task is not None:
+            self.sse_task.cancel()
+            try:
+                await self.sse_task
+            except asyncio.CancelledError:
+                pass
+            self.sse_task = None
+        await self._client.aclose()
 
 
-def main():
+async def main():
     """主函数"""
     try:
         # 从环境变量获取服务器 URL
@@ -161,21 +255,21 @@ def main():
         client = MCPClient(server_url=server_url)
         
         # 连接到服务器
-        init_response = client.connect()
-        logger.info(f"初始化响应: {json.dumps(init_response, indent=2)}")
+        init_response = await client.connect()
+        logger.info(f"初始化响应: {orjson.dumps(init_response, option=orjson.OPT_INDENT_2).decode()}")
         
         # 发送采样请求
-        sample_response = client.sample("你好，请介绍一下自己。")
-        logger.info(f"采样响应: {json.dumps(sample_response, indent=2)}")
+        sample_response = await client.sample("你好，请介绍一下自己。")
+        logger.info(f"采样响应: {orjson.dumps(sample_response, option=orjson.OPT_INDENT_2).decode()}")
         
         # 关闭会话
-        shutdown_response = client.shutdown()
-        logger.info(f"关闭响应: {json.dumps(shutdown_response, indent=2)}")
-        
+        shutdown_response = await client.shutdown()
+        logger.info(f"关闭响应: {orjson.dumps(shutdown_response, option=orjson.OPT_INDENT_2).decode()}")
+    
     except Exception as e:
         logger.exception(f"客户端错误: {e}")
         sys.exit(1)
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
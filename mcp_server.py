@@ -7,18 +7,36 @@ MCP 服务器实现
 """
 
 import os
+import re
 import sys
-import json
+import signal
 import logging
+import multiprocessing
 import asyncio
+import orjson
 import uvicorn
+from contextlib import asynccontextmanager
+from typing import Optional, Set
 from fastapi import FastAPI, Request
 from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 
+# uvloop / httptools 为可选加速依赖，未安装（如 Windows）时回退到标准实现
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+try:
+    import httptools
+except ImportError:
+    httptools = None
+
 # 导入基础路由器
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from routers.base_router import MCPBaseRouter
+from routers.base_router import (
+    MCPBaseRouter, ORJSONResponse, RawJSON, sse_encoder, HEARTBEAT_PREFIX, HEARTBEAT_SUFFIX
+)
 
 # 配置日志
 logging.basicConfig(
@@ -27,19 +45,71 @@ logging.basicConfig(
 )
 logger = logging.getLogger("mcp_server")
 
+# 日志格式未使用线程、进程和调用位置信息，关闭相关采集以降低每条日志记录的开销
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
+logging._srcfile = None
+
 # 加载环境变量
 load_dotenv()
 
+# 非空白字符序列，用于估算提示词的词元数
+WORD_PATTERN = re.compile(r"\S+")
+
+# SSE 心跳间隔（秒）
+HEARTBEAT_INTERVAL = 30
+
 class MCPServer:
     """MCP 服务器类"""
     
-    def __init__(self, host: str = "0.0.0.0", port: int = 8000):
+    def __init__(self, host: str = "0.0.0.0", port: int = 8000, workers: int = 1):
         """初始化 MCP 服务器"""
         self.host = host
         self.port = port
-        self.app = FastAPI(title="MCP Server", description="Model Context Protocol Server")
+        self.workers = workers
+        
+        # API 端点及预编码的 SSE 端点帧：通过 MCP_PUBLIC_URL 指定公开地址时预先生成，所有连接复用；
+        # 否则每个连接根据自身的请求地址生成，不能让某个客户端的 Host 头影响其他客户端
+        self.api_endpoint: Optional[str] = None
+        self._endpoint_frame: Optional[bytes] = None
+        public_url = os.environ.get("MCP_PUBLIC_URL")
+        if public_url:
+            self.api_endpoint = f"{public_url.rstrip('/')}/api"
+            self._endpoint_frame = self._build_endpoint_frame(self.api_endpoint)
+        
+        # 所有 SSE 连接的消息队列，由共享的心跳任务统一广播
+        self._sse_queues: Set[asyncio.Queue] = set()
+        
+        self.app = FastAPI(
+            title="MCP Server",
+            description="Model Context Protocol Server",
+            default_response_class=ORJSONResponse,
+            lifespan=self._lifespan
+        )
         self.router = MCPBaseRouter()
         
+        # 预序列化初始化响应中不变的部分（去掉首尾花括号），只有协议版本需要每次填充
+        self._init_tail = orjson.dumps({
+            "capabilities": {
+                "logging": {},
+                "prompts": {
+                    "listChanged": True
+                },
+                "resources": {
+                    "subscribe": True,
+                    "listChanged": True
+                },
+                "tools": {
+                    "listChanged": True
+                }
+            },
+            "serverInfo": {
+                "name": "MCPServer",
+                "version": "1.0.0"
+            }
+        })[1:-1]
+        
         # 注册方法处理器
         self._register_methods()
         
@@ -56,6 +126,30 @@ class MCPServer:
         async def sse_endpoint(request: Request):
             return await self.handle_sse_connection(request)
         
+    @asynccontextmanager
+    async def _lifespan(self, app: FastAPI):
+        """应用生命周期：启动时创建共享心跳任务，关闭时取消"""
+        heartbeat_task = asyncio.create_task(self._heartbeat_broadcaster())
+        try:
+            yield
+        finally:
+            heartbeat_task.cancel()
+    
+    async def _heartbeat_broadcaster(self):
+        """每个周期编码一次心跳帧并广播到所有 SSE 连接"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if not self._sse_queues:
+                continue
+            frame = HEARTBEAT_PREFIX + f"{loop.time():.3f}".encode() + HEARTBEAT_SUFFIX
+            for queue in self._sse_queues:
+                try:
+                    queue.put_nowait(frame)
+                except asyncio.QueueFull:
+                    # 客户端消费过慢时丢弃心跳，不影响其他连接
+                    pass
+        
     def _register_methods(self):
         """注册方法处理器"""
         # 注册初始化方法
@@ -67,19 +161,30 @@ class MCPServer:
         # 注册其他方法
         self.router.register_method("shutdown", self.handle_shutdown)
     
+    @staticmethod
+    def _build_endpoint_frame(api_endpoint: str) -> bytes:
+        """预编码 SSE 端点帧"""
+        return b"event: endpoint\ndata: " + sse_encoder.encode({"uri": api_endpoint}) + b"\n\n"
+    
     async def handle_sse_connection(self, request: Request):
         """处理 SSE 连接"""
         async def event_generator():
             # 发送端点信息 - 修复：返回正确的API端点
-            base_url = str(request.url).split("/sse")[0]
-            api_endpoint = f"{base_url}/api"
-            yield f"event: endpoint\ndata: {json.dumps({'uri': api_endpoint})}\n\n"
+            endpoint_frame = self._endpoint_frame
+            if endpoint_frame is None:
+                endpoint_frame = self._build_endpoint_frame(str(request.base_url).rstrip("/") + "/api")
             
-            # 保持连接活跃
-            while True:
-                # 每 30 秒发送一次心跳
-                await asyncio.sleep(30)
-                yield f"event: heartbeat\ndata: {json.dumps({'timestamp': asyncio.get_event_loop().time()})}\n\n"
+            # 注册到心跳广播，连接断开时注销
+            queue = asyncio.Queue(maxsize=16)
+            self._sse_queues.add(queue)
+            try:
+                yield endpoint_frame
+                
+                # 保持连接活跃，转发广播的心跳帧
+                while True:
+                    yield await queue.get()
+            finally:
+                self._sse_queues.discard(queue)
         
         return StreamingResponse(
             event_generator(),
@@ -91,55 +196,41 @@ class MCPServer:
             }
         )
         
-    def handle_initialize(self, params: dict) -> dict:
+    def handle_initialize(self, params: dict) -> RawJSON:
         """处理初始化请求"""
-        logger.info(f"收到初始化请求: {params}")
+        logger.info("收到初始化请求: %s", params)
         
         # 获取协议版本
         protocol_version = params.get("protocolVersion", "2024-11-05")
         
         # 返回服务器能力
-        return {
-            "protocolVersion": protocol_version,
-            "capabilities": {
-                "logging": {},
-                "prompts": {
-                    "listChanged": True
-                },
-                "resources": {
-                    "subscribe": True,
-                    "listChanged": True
-                },
-                "tools": {
-                    "listChanged": True
-                }
-            },
-            "serverInfo": {
-                "name": "MCPServer",
-                "version": "1.0.0"
-            }
-        }
+        return RawJSON(
+            b'{"protocolVersion":' + orjson.dumps(protocol_version) + b"," + self._init_tail + b"}"
+        )
     
     async def handle_sample(self, params: dict) -> dict:
         """处理采样请求"""
-        logger.info(f"收到采样请求: {params}")
+        logger.info("收到采样请求: %s", params)
         
         # 获取提示词
         prompt = params.get("prompt", "")
         
+        # 只统计一次词数，且不构建中间列表
+        prompt_tokens = sum(1 for _ in WORD_PATTERN.finditer(prompt))
+        
         # 模拟采样响应
         return {
             "content": f"这是对提示词 '{prompt[:30]}...' 的模拟响应。在实际实现中，这里应该调用 AI 模型 API。",
             "usage": {
-                "prompt_tokens": len(prompt.split()),
+                "prompt_tokens": prompt_tokens,
                 "completion_tokens": 50,
-                "total_tokens": len(prompt.split()) + 50
+                "total_tokens": prompt_tokens + 50
             }
         }
     
     def handle_shutdown(self, params: dict) -> dict:
         """处理关闭请求"""
-        logger.info(f"收到关闭请求: {params}")
+        logger.info("收到关闭请求: %s", params)
         
         # 安排服务器关闭
         asyncio.create_task(self._shutdown())
@@ -150,26 +241,85 @@ class MCPServer:
         """关闭服务器"""
         logger.info("服务器将在 2 秒后关闭...")
         await asyncio.sleep(2)
-        os._exit(0)
+        if multiprocessing.parent_process() is not None:
+            # 多进程模式下（当前为工作进程）通知主进程关闭所有工作进程，否则退出的工作进程会被重新拉起
+            os.kill(os.getppid(), signal.SIGTERM)
+        else:
+            os._exit(0)
     
     def run(self):
-        """运行服务器"""
-        logger.info(f"启动 MCP 服务器，监听 {self.host}:{self.port}")
-        uvicorn.run(self.app, host=self.host, port=self.port)
+        """运行服务器
+        
+        workers 大于 1 时由各工作进程通过 app_factory 重新创建服务器，本实例的应用不会被使用
+        """
+        if self.workers > 1:
+            # 多进程模式下由各工作进程自行创建服务器，本实例不提供服务
+            run_workers(self.host, self.port, self.workers)
+            return
+        
+        logger.info("启动 MCP 服务器，监听 %s:%s，工作进程数: %s", self.host, self.port, self.workers)
+        uvicorn.run(self.app, **get_uvicorn_options(self.host, self.port))
+
+
+def get_uvicorn_options(host: str, port: int) -> dict:
+    """uvicorn 运行参数"""
+    # 优先使用 uvloop 事件循环和 httptools HTTP 解析器；关闭访问日志，
+    # 请求错误由路由器单独记录
+    return {
+        "host": host,
+        "port": port,
+        "loop": "uvloop" if uvloop is not None else "asyncio",
+        "http": "httptools" if httptools is not None else "h11",
+        "log_level": "info",
+        "access_log": False
+    }
+
+
+def run_workers(host: str, port: int, workers: int):
+    """以多进程模式运行服务器"""
+    logger.info("启动 MCP 服务器，监听 %s:%s，工作进程数: %s", host, port, workers)
+    # 各工作进程共享同一个监听套接字，由内核分配连接；
+    # 应用需以导入字符串形式加载，每个工作进程通过 app_factory 各自创建服务器
+    # 工作进程从环境变量读取配置，这里写入实际的主机、端口和工作进程数
+    os.environ["MCP_SERVER_HOST"] = host
+    os.environ["MCP_SERVER_PORT"] = str(port)
+    os.environ["MCP_SERVER_WORKERS"] = str(workers)
+    uvicorn.run(
+        "mcp_server:app_factory",
+        factory=True,
+        workers=workers,
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        **get_uvicorn_options(host, port)
+    )
+
+
+def get_server_config() -> dict:
+    """从环境变量获取服务器配置"""
+    return {
+        "host": os.environ.get("MCP_SERVER_HOST", "127.0.0.1"),
+        "port": int(os.environ.get("MCP_SERVER_PORT", 12000)),
+        "workers": int(os.environ.get("MCP_SERVER_WORKERS", os.cpu_count() or 1))
+    }
+
+
+def app_factory() -> FastAPI:
+    """应用工厂，多进程模式下由每个工作进程调用"""
+    return MCPServer(**get_server_config()).app
 
 
 def main():
     """主函数"""
     try:
-        # 从环境变量获取主机和端口
-        host = os.environ.get("MCP_SERVER_HOST", "127.0.0.1")
-        port = int(os.environ.get("MCP_SERVER_PORT", 12000))
+        # 从环境变量获取主机、端口和工作进程数
+        config = get_server_config()
         
-        # 创建并运行服务器
-        server = MCPServer(host=host, port=port)
-        server.run()
+        # 多进程模式下主进程只负责管理工作进程，无需创建服务器
+        if config["workers"] > 1:
+            run_workers(**config)
+        else:
+            MCPServer(**config).run()
     except Exception as e:
-        logger.exception(f"启动服务器时出错: {e}")
+        logger.exception("启动服务器时出错: %s", e)
         sys.exit(1)
 
 
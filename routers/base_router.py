@@ -6,42 +6,96 @@ MCP 服务基础路由器
 提供处理 MCP 协议请求的基础类
 """
 
-import json
 import logging
 import asyncio
 from typing import Dict, Any, Optional, List, Union, Callable
 
+import orjson
+import msgspec
 from fastapi import APIRouter, Request, Response, HTTPException
 from fastapi.responses import JSONResponse, StreamingResponse
-from pydantic import BaseModel, Field
 
 logger = logging.getLogger("mcp_router")
 
-class MCPRequest(BaseModel):
-    """MCP 请求模型"""
-    jsonrpc: str = Field("2.0", description="JSON-RPC 版本")
-    id: Optional[Union[str, int]] = Field(None, description="请求 ID")
-    method: str = Field(..., description="方法名称")
-    params: Optional[Dict[str, Any]] = Field(None, description="参数")
-
-class MCPError(BaseModel):
-    """MCP 错误模型"""
-    code: int = Field(..., description="错误代码")
-    message: str = Field(..., description="错误消息")
-    data: Optional[Any] = Field(None, description="错误数据")
-
-class MCPResponse(BaseModel):
-    """MCP 响应模型"""
-    jsonrpc: str = Field("2.0", description="JSON-RPC 版本")
-    id: Optional[Union[str, int]] = Field(None, description="请求 ID")
-    result: Optional[Any] = Field(None, description="结果")
-    error: Optional[MCPError] = Field(None, description="错误")
-
-class MCPNotification(BaseModel):
-    """MCP 通知模型"""
-    jsonrpc: str = Field("2.0", description="JSON-RPC 版本")
-    method: str = Field(..., description="方法名称")
-    params: Optional[Dict[str, Any]] = Field(None, description="参数")
+class RawJSON:
+    """预序列化的 JSON 片段
+    
+    方法处理器可以返回 RawJSON，序列化响应时直接写入其中的字节，不再重新编码
+    """
+    __slots__ = ("data",)
+    
+    def __init__(self, data: bytes):
+        self.data = data
+
+def _orjson_default(obj: Any) -> Any:
+    """orjson 扩展类型序列化"""
+    if isinstance(obj, RawJSON):
+        return orjson.Fragment(obj.data)
+    raise TypeError(f"无法序列化类型: {type(obj).__name__}")
+
+def _msgpack_enc_hook(obj: Any) -> Any:
+    """msgspec MessagePack 扩展类型序列化"""
+    if isinstance(obj, RawJSON):
+        return orjson.loads(obj.data)
+    raise NotImplementedError(f"无法序列化类型: {type(obj).__name__}")
+
+class ORJSONResponse(JSONResponse):
+    """使用 orjson 序列化的 JSON 响应"""
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_orjson_default)
+
+class MCPRequest(msgspec.Struct, gc=False):
+    """MCP 请求结构"""
+    jsonrpc: str                              # JSON-RPC 版本
+    method: str                               # 方法名称
+    id: Optional[Union[str, int]] = None      # 请求 ID
+    params: Optional[Dict[str, Any]] = None   # 参数
+
+class MCPError(msgspec.Struct, gc=False):
+    """MCP 错误结构"""
+    code: int                                 # 错误代码
+    message: str                              # 错误消息
+    data: Any = None                          # 错误数据
+
+class MCPResponse(msgspec.Struct, gc=False):
+    """MCP 响应结构"""
+    jsonrpc: str = "2.0"                      # JSON-RPC 版本
+    id: Optional[Union[str, int]] = None      # 请求 ID
+    result: Any = None                        # 结果
+    error: Optional[MCPError] = None          # 错误
+
+class MCPNotification(msgspec.Struct, gc=False):
+    """MCP 通知结构"""
+    method: str                               # 方法名称
+    jsonrpc: str = "2.0"                      # JSON-RPC 版本
+    params: Optional[Dict[str, Any]] = None   # 参数
+
+# msgspec 编解码器（模块级单例，避免每次请求重复创建）
+msgpack_encoder = msgspec.msgpack.Encoder(enc_hook=_msgpack_enc_hook)
+msgpack_decoder = msgspec.msgpack.Decoder(MCPRequest)
+# 请求体直接解码为请求结构；批量请求先切分为原始片段，再逐个解码以便单独报告错误
+request_decoder = msgspec.json.Decoder(MCPRequest)
+body_decoder = msgspec.json.Decoder(Union[MCPRequest, List[msgspec.Raw]])
+sse_encoder = msgspec.json.Encoder()
+
+# 常用错误代码的预编码响应片段，只有 id 和 data 需要在运行时填充
+ERROR_PREFIX = b'{"jsonrpc":"2.0","id":'
+ERROR_SUFFIX = b"}}"
+ERROR_TEMPLATES = {
+    code: (message, b',"error":{"code":%d,"message":%s,"data":' % (code, orjson.dumps(message)))
+    for code, message in (
+        (-32700, "解析错误"),
+        (-32600, "无效的请求"),
+        (-32601, "方法不存在"),
+        (-32602, "无效的参数"),
+        (-32603, "内部错误")
+    )
+}
+
+# 预编码的 SSE 心跳帧模板，只有时间戳部分需要在运行时填充
+HEARTBEAT_PREFIX = b"event: heartbeat\ndata: {\"timestamp\":"
+HEARTBEAT_SUFFIX = b"}\n\n"
 
 class MCPBaseRouter:
     """MCP 基础路由器类"""
@@ -57,81 +111,147 @@ class MCPBaseRouter:
         # 处理 JSON-RPC 请求的路由 - 修复：使用非空路径
         self.router.post("/")(self.handle_request)
         
+        # 处理 MessagePack 编码的 JSON-RPC 请求的路由
+        self.router.post("/msgpack")(self.handle_msgpack_request)
+        
         # 注意：SSE路由将在主应用中注册，这里不再注册
         
-    def register_method(self, method_name: str, handler: Callable):
-        """注册方法处理器"""
-        self.methods[method_name] = handler
+    def register_method(self, method_name: str, handler: Callable, params_type: Optional[type] = None):
+        """注册方法处理器
         
-    async def handle_request(self, request: Request) -> JSONResponse:
+        指定 params_type（msgspec.Struct 子类）时，参数在调用前转换为该结构，
+        结构校验失败返回 -32602 错误
+        """
+        # 注册时即判断是否为协程函数，避免每次请求重复检查
+        self.methods[method_name] = (handler, asyncio.iscoroutinefunction(handler), params_type)
+        
+    async def handle_request(self, request: Request) -> Response:
         """处理 MCP 请求"""
         try:
-            # 解析请求体
-            body = await request.json()
+            # 解析请求体，直接解码为请求结构，无需中间 dict
+            body = body_decoder.decode(await request.body())
             
-            # 验证是否为有效的 JSON-RPC 请求
-            if not isinstance(body, dict) or body.get("jsonrpc") != "2.0":
-                return self._create_error_response(
-                    None, -32600, "无效的请求", "请求不符合 JSON-RPC 2.0 规范"
-                )
+            # 批量请求：并发处理每个子请求，返回响应数组
+            if isinstance(body, list):
+                if not body:
+                    return self._create_error_response(
+                        None, -32600, "无效的请求", "批量请求不能为空"
+                    )
+                responses = await asyncio.gather(*[self._dispatch_raw(item) for item in body])
+                # 通知不需要返回结果
+                return ORJSONResponse(content=[r for r in responses if r is not None] or {})
             
-            # 解析请求
-            mcp_request = MCPRequest(**body)
-            
-            # 检查是否为通知（没有 ID）
-            is_notification = mcp_request.id is None
-            
-            # 查找方法处理器
-            method_name = mcp_request.method
-            handler = self.methods.get(method_name)
-            
-            if not handler:
-                if is_notification:
-                    return JSONResponse(content={})
-                return self._create_error_response(
-                    mcp_request.id, -32601, "方法不存在", f"方法 '{method_name}' 不存在"
-                )
-            
-            # 调用方法处理器
-            try:
-                result = await handler(mcp_request.params) if asyncio.iscoroutinefunction(handler) else handler(mcp_request.params)
-                
-                # 如果是通知，不需要返回结果
-                if is_notification:
-                    return JSONResponse(content={})
-                
-                # 返回成功响应
-                return JSONResponse(content={
-                    "jsonrpc": "2.0",
-                    "id": mcp_request.id,
-                    "result": result
-                })
-            except Exception as e:
-                logger.exception(f"处理方法 '{method_name}' 时出错")
-                if is_notification:
-                    return JSONResponse(content={})
-                return self._create_error_response(
-                    mcp_request.id, -32603, "内部错误", str(e)
-                )
-                
+            # 调用方法处理器，通知不需要返回结果
+            response = await self._dispatch_request(body)
+            return ORJSONResponse(content=response if response is not None else {})
+        
+        except msgspec.ValidationError as e:
+            return self._create_error_response(
+                None, -32600, "无效的请求", str(e)
+            )
         except Exception as e:
             logger.exception("处理请求时出错")
             return self._create_error_response(
                 None, -32700, "解析错误", str(e)
             )
     
+    async def handle_msgpack_request(self, request: Request) -> Response:
+        """处理 MessagePack 编码的 MCP 请求
+        
+        响应为带 4 字节大端长度前缀的 MessagePack 帧
+        """
+        try:
+            # 直接解码为请求结构，无需中间 dict
+            mcp_request = msgpack_decoder.decode(await request.body())
+            response = await self._dispatch_request(mcp_request)
+        except msgspec.ValidationError as e:
+            response = self._create_error(None, -32600, "无效的请求", str(e))
+        except Exception as e:
+            logger.exception("处理请求时出错")
+            response = self._create_error(None, -32700, "解析错误", str(e))
+        
+        return self._create_msgpack_response(response if response is not None else {})
+    
+    async def _dispatch_raw(self, raw: msgspec.Raw) -> Optional[Union[Dict[str, Any], RawJSON]]:
+        """解码并处理批量请求中的单个请求"""
+        try:
+            mcp_request = request_decoder.decode(raw)
+        except msgspec.ValidationError as e:
+            return self._create_error(None, -32600, "无效的请求", str(e))
+        return await self._dispatch_request(mcp_request)
+    
+    async def _dispatch_request(self, mcp_request: MCPRequest) -> Optional[Union[Dict[str, Any], RawJSON]]:
+        """验证并处理单个 JSON-RPC 请求"""
+        # 字段类型已在解码时校验，这里只需检查协议版本
+        if mcp_request.jsonrpc != "2.0":
+            return self._create_error(
+                None, -32600, "无效的请求", "请求不符合 JSON-RPC 2.0 规范"
+            )
+        
+        return await self._dispatch(mcp_request.id, mcp_request.method, mcp_request.params)
+    
+    async def _dispatch(self, request_id: Optional[Union[str, int]], method_name: str,
+                        params: Optional[Dict[str, Any]]) -> Optional[Union[Dict[str, Any], RawJSON]]:
+        """调用方法处理器并构建响应，通知（没有 ID）返回 None"""
+        # 检查是否为通知（没有 ID）
+        is_notification = request_id is None
+        
+        # 查找方法处理器
+        handler, is_async, params_type = self.methods.get(method_name, (None, False, None))
+        
+        if not handler:
+            if is_notification:
+                return None
+            return self._create_error(
+                request_id, -32601, "方法不存在", f"方法 '{method_name}' 不存在"
+            )
+        
+        # 按注册的参数结构校验并转换参数
+        if params_type is not None:
+            try:
+                params = msgspec.convert(params if params is not None else {}, params_type)
+            except msgspec.ValidationError as e:
+                if is_notification:
+                    return None
+                return self._create_error(
+                    request_id, -32602, "无效的参数", str(e)
+                )
+        
+        # 调用方法处理器
+        try:
+            result = await handler(params) if is_async else handler(params)
+        except Exception as e:
+            logger.exception("处理方法 '%s' 时出错", method_name)
+            if is_notification:
+                return None
+            return self._create_error(
+                request_id, -32603, "内部错误", str(e)
+            )
+        
+        # 如果是通知，不需要返回结果
+        if is_notification:
+            return None
+        
+        # 返回成功响应
+        return {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "result": result
+        }
+    
     async def handle_sse_connection(self, request: Request):
         """处理 SSE 连接"""
         async def event_generator():
             # 发送端点信息
             endpoint = str(request.url).replace("/sse", "")
-            yield f"event: endpoint\ndata: {json.dumps({'uri': endpoint})}\n\n"
+            yield b"event: endpoint\ndata: " + sse_encoder.encode({"uri": endpoint}) + b"\n\n"
             
             # 保持连接活跃
+            loop = asyncio.get_running_loop()
             while True:
                 # 每 30 秒发送一次心跳
                 await asyncio.sleep(30)
-                yield f"event: heartbeat\ndata: {json.dumps({'timestamp': asyncio.get_event_loop().time()})}\n\n"
+                yield HEARTBEAT_PREFIX + f"{loop.time():.3f}".encode() + HEARTBEAT_SUFFIX
         
         return StreamingResponse(
             event_generator(),
@@ -143,17 +263,28 @@ class MCPBaseRouter:
             }
         )
     
-    def _create_error_response(self, id: Optional[Union[str, int]], code: int, message: str, data: Any = None) -> JSONResponse:
+    def _create_error(self, id: Optional[Union[str, int]], code: int, message: str, data: Any = None) -> RawJSON:
+        """创建错误响应对象（预编码的 JSON）"""
+        template = ERROR_TEMPLATES.get(code)
+        if template is not None and template[0] == message:
+            middle = template[1]
+        else:
+            middle = b',"error":{"code":%d,"message":%s,"data":' % (code, orjson.dumps(message))
+        return RawJSON(
+            ERROR_PREFIX + orjson.dumps(id) + middle + orjson.dumps(data, default=_orjson_default) + ERROR_SUFFIX
+        )
+    
+    def _create_error_response(self, id: Optional[Union[str, int]], code: int, message: str, data: Any = None) -> Response:
         """创建错误响应"""
-        return JSONResponse(content={
-            "jsonrpc": "2.0",
-            "id": id,
-            "error": {
-                "code": code,
-                "message": message,
-                "data": data
-            }
-        })
+        return Response(content=self._create_error(id, code, message, data).data, media_type="application/json")
+    
+    def _create_msgpack_response(self, content: Any) -> Response:
+        """创建带 4 字节大端长度前缀的 MessagePack 响应"""
+        # 预留帧头后直接编码到同一缓冲区，避免额外拷贝
+        buffer = bytearray(4)
+        msgpack_encoder.encode_into(content, buffer, 4)
+        buffer[:4] = (len(buffer) - 4).to_bytes(4, "big")
+        return Response(content=bytes(buffer), media_type="application/msgpack")
     
     def create_notification(self, method: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """创建通知"""
@@ -168,13 +299,13 @@ class MCPBaseRouter:
     # 同步方法示例
     def handle_sync_method(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """处理同步方法示例"""
-        logger.info(f"同步处理方法，参数: {params}")
+        logger.info("同步处理方法，参数: %s", params)
         return {"status": "success", "message": "同步方法处理成功", "params": params}
     
     # 异步方法示例
     async def handle_async_method(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """处理异步方法示例"""
-        logger.info(f"异步处理方法，参数: {params}")
+        logger.info("异步处理方法，参数: %s", params)
         # 模拟异步操作
         await asyncio.sleep(0.1)
         return {"status": "success", "message": "异步方法处理成功", "params": params}
\ No newline at end of file
@@ -9,7 +9,9 @@ MCP 提示词管理路由器
 import logging
 from typing import Dict, Any, Optional, List
 
-from .base_router import MCPBaseRouter
+import orjson
+
+from .base_router import MCPBaseRouter, RawJSON
 
 logger = logging.getLogger("prompt_router")
 
@@ -20,6 +22,8 @@ class PromptRouter(MCPBaseRouter):
         """初始化路由器"""
         super().__init__()
         self.prompts = {}
+        # 已序列化的提示词列表，提示词变更时失效
+        self._list_cache: Optional[bytes] = None
         self._register_methods()
         self._register_prompts()
         
@@ -47,16 +51,17 @@ class PromptRouter(MCPBaseRouter):
             "content": "请为以下代码生成详细的文档，包括函数说明、参数描述和使用示例：\n\n{{code}}"
         }
     
-    def handle_list_prompts(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def handle_list_prompts(self, params: Optional[Dict[str, Any]] = None) -> RawJSON:
         """处理提示词列表请求"""
         logger.info("处理提示词列表请求")
         
-        # 构建提示词列表
-        prompts_list = list(self.prompts.values())
+        # 构建提示词列表，序列化结果缓存到下次变更
+        if self._list_cache is None:
+            self._list_cache = orjson.dumps({
+                "prompts": list(self.prompts.values())
+            })
         
-        return {
-            "prompts": prompts_list
-        }
+        return RawJSON(self._list_cache)
     
     def handle_get_prompt(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """处理获取提示词请求"""
@@ -64,7 +69,7 @@ class PromptRouter(MCPBaseRouter):
             raise ValueError("缺少提示词 ID 参数")
         
         prompt_id = params["id"]
-        logger.info(f"处理获取提示词请求，提示词 ID: {prompt_id}")
+        logger.info("处理获取提示词请求，提示词 ID: %s", prompt_id)
         
         # 查找提示词
         if prompt_id not in self.prompts:
@@ -78,13 +83,14 @@ class PromptRouter(MCPBaseRouter):
             raise ValueError("缺少必要参数")
         
         prompt_id = params["id"]
-        logger.info(f"处理创建提示词请求，提示词 ID: {prompt_id}")
+        logger.info("处理创建提示词请求，提示词 ID: %s", prompt_id)
         
         # 检查是否已存在
         if prompt_id in self.prompts:
             raise ValueError(f"提示词 ID '{prompt_id}' 已存在")
         
         # 创建提示词
+        self._list_cache = None
         self.prompts[prompt_id] = {
             "id": prompt_id,
             "name": params.get("name", prompt_id),
@@ -100,13 +106,14 @@ class PromptRouter(MCPBaseRouter):
             raise ValueError("缺少提示词 ID 参数")
         
         prompt_id = params["id"]
-        logger.info(f"处理更新提示词请求，提示词 ID: {prompt_id}")
+        logger.info("处理更新提示词请求，提示词 ID: %s", prompt_id)
         
         # 检查是否存在
         if prompt_id not in self.prompts:
             raise ValueError(f"提示词 ID '{prompt_id}' 不存在")
         
         # 更新提示词
+        self._list_cache = None
         prompt = self.prompts[prompt_id]
         if "name" in params:
             prompt["name"] = params["name"]
@@ -123,13 +130,14 @@ class PromptRouter(MCPBaseRouter):
             raise ValueError("缺少提示词 ID 参数")
         
         prompt_id = params["id"]
-        logger.info(f"处理删除提示词请求，提示词 ID: {prompt_id}")
+        logger.info("处理删除提示词请求，提示词 ID: %s", prompt_id)
         
         # 检查是否存在
         if prompt_id not in self.prompts:
             raise ValueError(f"提示词 ID '{prompt_id}' 不存在")
         
         # 删除提示词
+        self._list_cache = None
         prompt = self.prompts.pop(prompt_id)
         
         return {
@@ -7,15 +7,28 @@ MCP 资源管理路由器
 """
 
 import os
-import json
+import re
 import base64
 import logging
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Set
 
 from .base_router import MCPBaseRouter
 
 logger = logging.getLogger("resource_router")
 
+# 分词：英文/数字按单词切分，中文按连续字符切分后再拆成二元组
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+|[\u4e00-\u9fff]+")
+
+def tokenize(text: str) -> Set[str]:
+    """将文本切分为用于检索的词元集合"""
+    tokens = set()
+    for word in TOKEN_PATTERN.findall(text.lower()):
+        if len(word) > 1 and not word.isascii():
+            tokens.update(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.add(word)
+    return tokens
+
 class ResourceRouter(MCPBaseRouter):
     """资源管理路由器"""
     
@@ -23,7 +36,11 @@ class ResourceRouter(MCPBaseRouter):
         """初始化路由器"""
         super().__init__()
         self.resources = {}
+        self._index: Dict[str, List[str]] = {}
+        self._resource_token_counts: Dict[str, int] = {}
         self._register_methods()
+        self._register_resources()
+        self._build_index()
         
     def _register_methods(self):
         """注册方法处理器"""
@@ -32,36 +49,48 @@ class ResourceRouter(MCPBaseRouter):
         self.register_method("resources/search", self.handle_search_resources)
         self.register_method("resources/subscribe", self.handle_subscribe_resources)
         
-    def handle_list_resources(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """处理资源列表请求"""
-        logger.info(f"处理资源列表请求，参数: {params}")
+    def _register_resources(self):
+        """注册示例资源"""
+        self.resources["resource1"] = {
+            "id": "resource1",
+            "name": "示例代码文件",
+            "type": "code",
+            "path": "/examples/example.py",
+            "metadata": {
+                "language": "python",
+                "size": 1024
+            }
+        }
         
-        # 示例资源列表
-        resources = [
-            {
-                "id": "resource1",
-                "name": "示例代码文件",
-                "type": "code",
-                "path": "/examples/example.py",
-                "metadata": {
-                    "language": "python",
-                    "size": 1024
-                }
-            },
-            {
-                "id": "resource2",
-                "name": "示例文档",
-                "type": "document",
-                "path": "/docs/example.md",
-                "metadata": {
-                    "format": "markdown",
-                    "size": 2048
-                }
+        self.resources["resource2"] = {
+            "id": "resource2",
+            "name": "示例文档",
+            "type": "document",
+            "path": "/docs/example.md",
+            "metadata": {
+                "format": "markdown",
+                "size": 2048
             }
-        ]
+        }
+    
+    def _build_index(self):
+        """构建倒排索引：词元 -> 资源 ID 列表"""
+        self._index = {}
+        self._resource_token_counts = {}
+        for resource_id, resource in self.resources.items():
+            text = " ".join([resource["name"], resource["type"], resource["path"]] +
+                            [str(value) for value in resource.get("metadata", {}).values()])
+            tokens = tokenize(text)
+            self._resource_token_counts[resource_id] = len(tokens)
+            for token in tokens:
+                self._index.setdefault(token, []).append(resource_id)
+    
+    def handle_list_resources(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """处理资源列表请求"""
+        logger.info("处理资源列表请求，参数: %s", params)
         
         return {
-            "resources": resources
+            "resources": list(self.resources.values())
         }
     
     def handle_get_resource(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
@@ -70,7 +99,7 @@ class ResourceRouter(MCPBaseRouter):
             raise ValueError("缺少资源 ID 参数")
         
         resource_id = params["id"]
-        logger.info(f"处理获取资源请求，资源 ID: {resource_id}")
+        logger.info("处理获取资源请求，资源 ID: %s", resource_id)
         
         # 示例资源内容
         if resource_id == "resource1":
@@ -122,27 +151,26 @@ if __name__ == "__main__":
             raise ValueError("缺少搜索查询参数")
         
         query = params["query"]
-        logger.info(f"处理搜索资源请求，查询: {query}")
+        logger.info("处理搜索资源请求，查询: %s", query)
         
-        # 示例搜索结果
-        results = []
-        if "python" in query.lower():
-            results.append({
-                "id": "resource1",
-                "name": "示例代码文件",
-                "type": "code",
-                "path": "/examples/example.py",
-                "relevance": 0.95
-            })
+        # 通过倒排索引统计每个资源命中的查询词元数
+        matches: Dict[str, int] = {}
+        for token in tokenize(query):
+            for resource_id in self._index.get(token, ()):
+                matches[resource_id] = matches.get(resource_id, 0) + 1
         
-        if "文档" in query or "document" in query.lower():
+        # 按命中词元占资源词元的比例排序
+        results = []
+        for resource_id, count in matches.items():
+            resource = self.resources[resource_id]
             results.append({
-                "id": "resource2",
-                "name": "示例文档",
-                "type": "document",
-                "path": "/docs/example.md",
-                "relevance": 0.85
+                "id": resource_id,
+                "name": resource["name"],
+                "type": resource["type"],
+                "path": resource["path"],
+                "relevance": round(count / self._resource_token_counts[resource_id], 2)
             })
+        results.sort(key=lambda result: result["relevance"], reverse=True)
         
         return {
             "query": query,
@@ -155,7 +183,7 @@ if __name__ == "__main__":
             raise ValueError("缺少资源 ID 列表参数")
         
         resource_ids = params["resourceIds"]
-        logger.info(f"处理订阅资源变更请求，资源 ID: {resource_ids}")
+        logger.info("处理订阅资源变更请求，资源 ID: %s", resource_ids)
         
         # 在实际应用中，这里会设置订阅，并在资源变更时发送通知
         return {
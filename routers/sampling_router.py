@@ -6,15 +6,56 @@ MCP 采样服务路由器
 处理模型采样相关的 MCP 请求
 """
 
-import json
+import os
+import sys
+import time
 import logging
 import asyncio
-from typing import Dict, Any, Optional, List, Union
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple, Union, AsyncIterator
 
-from .base_router import MCPBaseRouter
+import orjson
+import msgspec
+
+from .base_router import MCPBaseRouter, RawJSON
 
 logger = logging.getLogger("sampling_router")
 
+# 流式输出块之间的间隔（秒）
+STREAM_CHUNK_INTERVAL = 0.3
+
+# 流式输出缓冲区达到该字节数，或最早的待写帧等待超过该时间（秒）时写出
+STREAM_FLUSH_SIZE = 4096
+STREAM_FLUSH_DELAY = 0.05
+
+# 流式生成任务队列容量与处理协程数量
+STREAM_QUEUE_SIZE = 1024
+STREAM_WORKERS = 32
+
+# 生成结果缓存容量与有效期（秒）
+GENERATE_CACHE_SIZE = 1024
+GENERATE_CACHE_TTL = 60.0
+
+class ListModelsParams(msgspec.Struct, gc=False):
+    """列出模型请求参数"""
+    capabilities: Optional[List[str]] = None  # 需要具备的能力
+
+class GetModelParams(msgspec.Struct, gc=False):
+    """获取模型信息请求参数"""
+    id: str                                   # 模型 ID
+
+class GenerateParams(msgspec.Struct, gc=False):
+    """生成请求参数"""
+    model: str                                # 模型 ID
+    prompt: Any                               # 提示词
+    cache: bool = True                        # 是否使用生成结果缓存
+
+class StreamParams(msgspec.Struct, gc=False):
+    """流式生成请求参数"""
+    model: str                                # 模型 ID
+    prompt: Any                               # 提示词
+
 class SamplingRouter(MCPBaseRouter):
     """采样服务路由器"""
     
@@ -41,137 +82,296 @@ class SamplingRouter(MCPBaseRouter):
                 "capabilities": ["chat", "completion"]
             }
         }
+        
+        # 能力名称驻留并改为元组，集合判断与序列化复用同一批字符串对象
+        for model in self.models.values():
+            model["capabilities"] = tuple(sys.intern(c) for c in model["capabilities"])
+        
+        # 模型表是静态的：预先生成模型快照和每个模型的能力集合（与模型数据分开存放，不影响响应内容）
+        self._models_tuple = tuple(self.models.values())
+        self._model_capsets = {
+            model_id: frozenset(model["capabilities"]) for model_id, model in self.models.items()
+        }
+        
+        # 预先计算每个模型的 ID 片段，避免每次请求时字符串替换
+        self._safe_ids = {model_id: model_id.replace("-", "_") for model_id in self.models}
+        self._gen_id_prefix = {model_id: "gen_" + safe_id for model_id, safe_id in self._safe_ids.items()}
+        
+        # 模拟输出只取决于模型 ID，预先生成每个模型的输出文本与流式输出块
+        self._gen_templates = {
+            model_id: f"这是来自 {model_id} 模型的示例输出，基于您的提示词。" for model_id in self.models
+        }
+        self._stream_chunks = {
+            model_id: (
+                "这是", "来自", f" {model_id} ", "模型的", "示例", "流式", "输出，",
+                "基于", "您的", "提示词。"
+            )
+            for model_id in self.models
+        }
+        
+        # 流式输出块预先编码为 SSE 帧，拼接在同一缓冲区中，输出时按偏移量切片
+        self._stream_frames = {}
+        for model_id, chunks in self._stream_chunks.items():
+            frames = bytearray()
+            offsets = [0]
+            for chunk in chunks:
+                frames += f"data: {chunk}\n\n".encode()
+                offsets.append(len(frames))
+            self._stream_frames[model_id] = (memoryview(bytes(frames)), tuple(offsets))
+        
+        # 静态响应预先序列化，直接写入响应体
+        self._list_models_cached = RawJSON(orjson.dumps({"models": self._models_tuple}))
+        self._model_cached = {
+            model_id: RawJSON(orjson.dumps(model)) for model_id, model in self.models.items()
+        }
+        # 模拟生成延迟（秒），默认不延迟
+        self._sim_latency = float(os.environ.get("MCP_SIM_LATENCY") or 0)
+        
+        # 生成结果缓存：(模型 ID, 提示词摘要) -> (写入时间, 预序列化的响应)，按最近使用顺序排列
+        self._generate_cache = OrderedDict()
+        
+        # 流式生成任务队列与处理协程（首次使用时在事件循环中创建）
+        self._stream_queue: Optional[asyncio.Queue] = None
+        self._stream_workers: List[asyncio.Task] = []
+        self._stream_idle = 0
         self._register_methods()
         
     def _register_methods(self):
         """注册方法处理器"""
-        self.register_method("sampling/list_models", self.handle_list_models)
-        self.register_method("sampling/get_model", self.handle_get_model)
-        self.register_method("sampling/generate", self.handle_generate)
-        self.register_method("sampling/stream", self.handle_stream)
+        self.register_method("sampling/list_models", self.handle_list_models, ListModelsParams)
+        self.register_method("sampling/get_model", self.handle_get_model, GetModelParams)
+        self.register_method("sampling/generate", self.handle_generate, GenerateParams)
+        self.register_method("sampling/stream", self.handle_stream, StreamParams)
         self.register_method("sampling/cancel", self.handle_cancel)
         
-    def handle_list_models(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def handle_list_models(self, params: ListModelsParams) -> Union[Dict[str, Any], RawJSON]:
         """处理列出模型请求"""
-        logger.info(f"处理列出模型请求，参数: {params}")
+        logger.info("处理列出模型请求，参数: %s", params)
         
         # 过滤模型（如果有能力要求）
-        models = list(self.models.values())
-        if params and "capabilities" in params:
-            required_capabilities = params["capabilities"]
-            models = [
-                model for model in models 
-                if all(cap in model["capabilities"] for cap in required_capabilities)
-            ]
-            
+        if params.capabilities is None:
+            return self._list_models_cached
+        
+        required_capabilities = frozenset(params.capabilities)
         return {
-            "models": models
+            "models": [
+                model for model in self._models_tuple
+                if required_capabilities <= self._model_capsets[model["id"]]
+            ]
         }
     
-    def handle_get_model(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def handle_get_model(self, params: GetModelParams) -> RawJSON:
         """处理获取模型信息请求"""
-        if not params or "id" not in params:
-            raise ValueError("缺少模型 ID 参数")
-            
-        model_id = params["id"]
-        logger.info(f"处理获取模型信息请求，模型 ID: {model_id}")
+        model_id = params.id
+        logger.info("处理获取模型信息请求，模型 ID: %s", model_id)
         
-        if model_id not in self.models:
+        cached = self._model_cached.get(model_id)
+        if cached is None:
             raise ValueError(f"模型 ID '{model_id}' 不存在")
             
-        return self.models[model_id]
+        return cached
     
-    async def handle_generate(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    async def handle_generate(self, params: GenerateParams) -> Union[Dict[str, Any], RawJSON]:
         """处理生成请求"""
-        if not params:
-            raise ValueError("缺少请求参数")
-            
-        model_id = params.get("model")
+        model_id = params.model
+        prompt = params.prompt
         if not model_id:
             raise ValueError("缺少模型 ID 参数")
             
         if model_id not in self.models:
             raise ValueError(f"模型 ID '{model_id}' 不存在")
             
-        prompt = params.get("prompt")
         if not prompt:
             raise ValueError("缺少提示词参数")
             
-        logger.info(f"处理生成请求，模型: {model_id}, 提示词长度: {len(str(prompt))}")
+        # 提示词长度只计算一次；字符串无需再转换
+        text = prompt if isinstance(prompt, str) else str(prompt)
+        plen = len(text)
+        ptoks = plen >> 2
+        logger.info("处理生成请求，模型: %s, 提示词长度: %d", model_id, plen)
         
-        # 模拟生成过程
-        await asyncio.sleep(1)
+        # 相同模型与提示词的请求直接返回缓存结果（可通过 cache=False 关闭）
+        use_cache = params.cache
+        if use_cache:
+            key = (model_id, hashlib.blake2b(text.encode(), digest_size=16).hexdigest())
+            cached = self._generate_cache_get(key)
+            if cached is not None:
+                return cached
         
-        return {
-            "id": "gen_" + model_id.replace("-", "_"),
+        # 模拟生成过程（仅在设置 MCP_SIM_LATENCY 时）
+        if self._sim_latency:
+            await asyncio.sleep(self._sim_latency)
+        
+        response = {
+            "id": self._gen_id_prefix[model_id],
             "model": model_id,
-            "output": f"这是来自 {model_id} 模型的示例输出，基于您的提示词。",
+            "output": self._gen_templates[model_id],
             "usage": {
-                "prompt_tokens": len(str(prompt)) // 4,
+                "prompt_tokens": ptoks,
                 "completion_tokens": 20,
-                "total_tokens": len(str(prompt)) // 4 + 20
+                "total_tokens": ptoks + 20
             }
         }
+        
+        if use_cache:
+            self._generate_cache_put(key, response)
+        
+        return response
+    
+    def _generate_cache_get(self, key: Tuple[str, str]) -> Optional[RawJSON]:
+        """读取生成结果缓存，过期条目直接删除"""
+        entry = self._generate_cache.get(key)
+        if entry is None:
+            return None
+        
+        stored_at, response = entry
+        if time.monotonic() - stored_at > GENERATE_CACHE_TTL:
+            del self._generate_cache[key]
+            return None
+        
+        self._generate_cache.move_to_end(key)
+        return response
+    
+    def _generate_cache_put(self, key: Tuple[str, str], response: Dict[str, Any]):
+        """写入生成结果缓存，超出容量时淘汰最久未使用的条目
+        
+        响应以预序列化的 JSON 保存，命中时直接返回，调用方无法修改缓存内容
+        """
+        self._generate_cache[key] = (time.monotonic(), RawJSON(orjson.dumps(response)))
+        self._generate_cache.move_to_end(key)
+        while len(self._generate_cache) > GENERATE_CACHE_SIZE:
+            self._generate_cache.popitem(last=False)
     
-    async def handle_stream(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def handle_stream(self, params: StreamParams) -> Dict[str, Any]:
         """处理流式生成请求"""
-        if not params:
-            raise ValueError("缺少请求参数")
-            
-        model_id = params.get("model")
+        model_id = params.model
+        prompt = params.prompt
         if not model_id:
             raise ValueError("缺少模型 ID 参数")
             
         if model_id not in self.models:
             raise ValueError(f"模型 ID '{model_id}' 不存在")
             
-        prompt = params.get("prompt")
         if not prompt:
             raise ValueError("缺少提示词参数")
             
-        logger.info(f"处理流式生成请求，模型: {model_id}, 提示词长度: {len(str(prompt))}")
+        plen = len(prompt) if isinstance(prompt, str) else len(str(prompt))
+        logger.info("处理流式生成请求，模型: %s, 提示词长度: %d", model_id, plen)
         
         # 在实际实现中，这里应该返回一个流式响应的标识符
         # 客户端可以通过 SSE 连接接收流式输出
-        stream_id = f"stream_{model_id.replace('-', '_')}_{asyncio.get_event_loop().time()}"
+        stream_id = f"stream_{self._safe_ids[model_id]}_{time.monotonic_ns()}"
         
-        # 启动后台任务处理流式生成
-        asyncio.create_task(self._process_stream(stream_id, model_id, prompt))
+        # 交给固定数量的处理协程执行；队列已满时直接拒绝，不阻塞请求
+        if self._stream_queue is None:
+            self._start_stream_workers()
+        # 空闲处理协程多于排队任务时立即开始，否则需要排队等待
+        status = "started" if self._stream_idle > self._stream_queue.qsize() else "queued"
+        try:
+            self._stream_queue.put_nowait((stream_id, model_id, prompt))
+        except asyncio.QueueFull:
+            raise ValueError("流式生成任务过多，请稍后重试")
         
         return {
             "stream_id": stream_id,
             "model": model_id,
-            "status": "started"
+            "status": status
         }
     
-    async def _process_stream(self, stream_id: str, model_id: str, prompt: Any):
+    def _start_stream_workers(self):
+        """创建流式生成任务队列并启动处理协程"""
+        self._stream_queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self._stream_idle = STREAM_WORKERS
+        self._stream_workers = [
+            asyncio.create_task(self._stream_worker()) for _ in range(STREAM_WORKERS)
+        ]
+    
+    async def close(self):
+        """取消流式生成处理协程，丢弃尚未处理的任务"""
+        workers, self._stream_workers = self._stream_workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._stream_queue = None
+        self._stream_idle = 0
+    
+    async def _stream_worker(self):
+        """从队列中依次取出并处理流式生成任务"""
+        while True:
+            job = await self._stream_queue.get()
+            self._stream_idle -= 1
+            try:
+                await self._run_stream(*job)
+            except Exception:
+                logger.exception("流 %s 处理出错", job[0])
+            finally:
+                self._stream_queue.task_done()
+                self._stream_idle += 1
+    
+    async def _run_stream(self, stream_id: str, model_id: str, prompt: Any):
         """处理流式生成的后台任务"""
-        # 在实际实现中，这里应该调用模型 API 并通过 SSE 发送结果
-        # 这里只是模拟流式输出
-        logger.info(f"开始流式生成，ID: {stream_id}")
+        logger.info("开始流式生成，ID: %s", stream_id)
         
-        # 模拟流式输出
-        chunks = [
-            "这是", "来自", f" {model_id} ", "模型的", "示例", "流式", "输出，", 
-            "基于", "您的", "提示词。"
-        ]
+        # SSE 帧切片先累积，达到大小阈值、等待超过 STREAM_FLUSH_DELAY 或流结束时整体写出，不复制帧内容
+        loop = asyncio.get_running_loop()
+        pending: List[memoryview] = []
+        pending_size = 0
+        flush_handle: Optional[asyncio.TimerHandle] = None
+        
+        def flush():
+            nonlocal pending, pending_size, flush_handle
+            if flush_handle is not None:
+                flush_handle.cancel()
+                flush_handle = None
+            if pending:
+                self._write_stream(stream_id, pending)
+                pending = []
+                pending_size = 0
         
-        for chunk in chunks:
-            # 发送通知（在实际实现中，这应该通过 SSE 发送）
-            # 这里只是记录日志
-            logger.info(f"流 {stream_id} 输出: {chunk}")
-            await asyncio.sleep(0.3)
+        try:
+            async for frame in self._process_stream(model_id, prompt):
+                pending.append(frame)
+                pending_size += len(frame)
+                if pending_size >= STREAM_FLUSH_SIZE:
+                    flush()
+                elif flush_handle is None:
+                    flush_handle = loop.call_later(STREAM_FLUSH_DELAY, flush)
+        finally:
+            flush()
         
         # 发送完成通知
-        logger.info(f"流 {stream_id} 完成")
+        logger.info("流 %s 完成", stream_id)
+    
+    async def _process_stream(self, model_id: str, prompt: Any) -> AsyncIterator[memoryview]:
+        """按时间间隔逐块产出预编码的 SSE 帧"""
+        # 在实际实现中，这里应该调用模型 API
+        # 这里只是模拟流式输出
+        frames, offsets = self._stream_frames[model_id]
+        
+        # 各块的输出时间以开始时间为基准计算，不会累积误差
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        for i in range(len(offsets) - 1):
+            if i:
+                await asyncio.sleep(t0 + STREAM_CHUNK_INTERVAL * i - loop.time())
+            yield frames[offsets[i]:offsets[i + 1]]
+        await asyncio.sleep(t0 + STREAM_CHUNK_INTERVAL * (len(offsets) - 1) - loop.time())
+    
+    def _write_stream(self, stream_id: str, frames: List[memoryview]):
+        """写出 SSE 帧"""
+        # 发送通知（在实际实现中，这应该写入 SSE 连接，例如 transport.writelines(frames)）
+        # 这里只是记录调试日志
+        if logger.isEnabledFor(logging.DEBUG):
+            data = b"".join(frames)
+            logger.debug("流 %s 输出 %d 字节: %s", stream_id, len(data), data.decode())
     
     def handle_cancel(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """处理取消生成请求"""
-        if not params or "id" not in params:
+        gen_id = params.get("id") if params else None
+        if gen_id is None:
             raise ValueError("缺少生成 ID 参数")
             
-        gen_id = params["id"]
-        logger.info(f"处理取消生成请求，生成 ID: {gen_id}")
+        logger.info("处理取消生成请求，生成 ID: %s", gen_id)
         
         # 在实际实现中，这里应该取消正在进行的生成任务
         # 这里只是返回成功响应
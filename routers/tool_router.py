@@ -7,35 +7,133 @@ MCP 工具集成路由器
 """
 
 import os
-import json
+import sys
 import logging
 import asyncio
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple, Callable
 
-from .base_router import MCPBaseRouter
+import orjson
+import msgspec
+
+from .base_router import MCPBaseRouter, RawJSON
 
 logger = logging.getLogger("tool_router")
 
+# 单个工具专用快速处理器的源码模板，注册工具时生成
+# 工具 ID 以字面量写入，处理器通过命名空间中的 _handler 绑定
+FAST_HANDLER_TEMPLATE = """
+{def_kw} _fast_handler(params=None):
+    if params is None:
+        params = {{}}
+    _logger.info("处理执行工具请求，工具 ID: %s，参数: %s", {tool_id!r}, params)
+    try:
+        result = {await_kw}_handler(params)
+    except Exception as e:
+        _logger.exception("执行工具 '%s' 时出错", {tool_id!r})
+        return {{"id": {tool_id!r}, "status": "error", "error": str(e)}}
+    return {{"id": {tool_id!r}, "status": "success", "result": result}}
+"""
+
+class ExecuteToolParams(msgspec.Struct, gc=False):
+    """执行工具请求参数"""
+    id: str                                                          # 工具 ID
+    params: Dict[str, Any] = msgspec.field(default_factory=dict)     # 工具参数
+
+class ExecuteBatchParams(msgspec.Struct, gc=False):
+    """批量执行工具请求参数"""
+    calls: List[ExecuteToolParams]                                   # 工具调用列表
+
 class ToolRouter(MCPBaseRouter):
     """工具集成路由器"""
     
     def __init__(self):
         """初始化路由器"""
         super().__init__()
-        self.tools = {}
+        # 工具的公开描述与处理器分开存放，列表视图无需过滤处理器
+        self._tool_public: Dict[str, Dict[str, Any]] = {}
+        self._tool_handlers: Dict[str, Tuple[Callable, bool]] = {}
+        # 工具列表缓存：每次注册工具时版本号递增，缓存随之失效
+        self._cache_version = 0
+        self._tool_list_cached = None
+        self._tool_list_version = -1
+        
+        # 搜索工具的示例结果按范围预先分组
+        code_result = {
+            "path": "/examples/example.py",
+            "snippet": "def hello_world():",
+            "relevance": 0.95
+        }
+        docs_result = {
+            "path": "/docs/example.md",
+            "snippet": "# 示例文档",
+            "relevance": 0.85
+        }
+        self._search_results = {
+            "all": (code_result, docs_result),
+            "code": (code_result,),
+            "docs": (docs_result,)
+        }
+        
+        # 模拟 I/O 延迟（秒），默认不延迟
+        self._sim_latency = float(os.environ.get("MCP_SIM_LATENCY") or 0)
+        
+        # 文件系统工具的操作分派表
+        self._fs_dispatch = {
+            "read": self._fs_read,
+            "write": self._fs_write,
+            "list": self._fs_list,
+            "delete": self._fs_delete
+        }
         self._register_methods()
         self._register_tools()
         
     def _register_methods(self):
         """注册方法处理器"""
         self.register_method("tools/list", self.handle_list_tools)
-        self.register_method("tools/execute", self.handle_execute_tool)
+        self.register_method("tools/execute", self.handle_execute_tool, ExecuteToolParams)
+        self.register_method("tools/execute_batch", self.handle_execute_batch, ExecuteBatchParams)
         self.register_method("tools/cancel", self.handle_cancel_tool)
         
+    def register_tool(self, tool: Dict[str, Any]):
+        """注册工具"""
+        tool_id = tool["id"]
+        # 枚举值驻留并改为元组
+        for prop in tool["parameters"].get("properties", {}).values():
+            if "enum" in prop:
+                prop["enum"] = tuple(sys.intern(v) for v in prop["enum"])
+        self._tool_public[tool_id] = {
+            "id": tool_id,
+            "name": tool["name"],
+            "description": tool["description"],
+            "parameters": tool["parameters"]
+        }
+        # 注册时缓存处理器是否为协程函数，执行时无需再次检查
+        handler = tool["handler"]
+        is_coro = asyncio.iscoroutinefunction(handler)
+        self._tool_handlers[tool_id] = (handler, is_coro)
+        self._cache_version += 1
+        
+        # 同时注册该工具专用的 JSON-RPC 方法，直接调用处理器，跳过工具查找
+        self.register_method(f"tools/execute/{tool_id}", self._build_fast_handler(tool_id, handler, is_coro))
+    
+    def _build_fast_handler(self, tool_id: str, handler: Callable, is_coro: bool) -> Callable:
+        """生成单个工具的专用处理器
+        
+        处理器的参数即工具参数，协程处理器生成异步函数，普通处理器生成同步函数
+        """
+        source = FAST_HANDLER_TEMPLATE.format(
+            def_kw="async def" if is_coro else "def",
+            await_kw="await " if is_coro else "",
+            tool_id=tool_id
+        )
+        namespace = {"_handler": handler, "_logger": logger}
+        exec(compile(source, f"<tool {tool_id}>", "exec"), namespace)
+        return namespace["_fast_handler"]
+        
     def _register_tools(self):
         """注册工具"""
         # 注册示例工具
-        self.tools["search"] = {
+        self.register_tool({
             "id": "search",
             "name": "搜索工具",
             "description": "在代码库中搜索内容",
@@ -55,9 +153,9 @@ class ToolRouter(MCPBaseRouter):
                 "required": ["query"]
             },
             "handler": self._search_tool_handler
-        }
+        })
         
-        self.tools["fileSystem"] = {
+        self.register_tool({
             "id": "fileSystem",
             "name": "文件系统工具",
             "description": "访问和操作文件系统",
@@ -81,46 +179,65 @@ class ToolRouter(MCPBaseRouter):
                 "required": ["action", "path"]
             },
             "handler": self._file_system_tool_handler
-        }
+        })
     
-    def handle_list_tools(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def handle_list_tools(self, params: Optional[Dict[str, Any]] = None) -> RawJSON:
         """处理工具列表请求"""
         logger.info("处理工具列表请求")
         
-        # 构建工具列表（不包含处理器）
-        tools_list = []
-        for tool_id, tool in self.tools.items():
-            tools_list.append({
-                "id": tool["id"],
-                "name": tool["name"],
-                "description": tool["description"],
-                "parameters": tool["parameters"]
-            })
+        # 工具注册后首次请求时序列化工具列表
+        if self._tool_list_version != self._cache_version:
+            self._tool_list_cached = RawJSON(orjson.dumps({"tools": list(self._tool_public.values())}))
+            self._tool_list_version = self._cache_version
         
-        return {
-            "tools": tools_list
-        }
+        return self._tool_list_cached
     
-    async def handle_execute_tool(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    async def handle_execute_tool(self, params: ExecuteToolParams) -> Dict[str, Any]:
         """处理执行工具请求（异步）"""
-        if not params or "id" not in params:
-            raise ValueError("缺少工具 ID 参数")
+        return await self._dispatch_one(params)
+    
+    async def handle_execute_batch(self, params: ExecuteBatchParams) -> Dict[str, Any]:
+        """处理批量执行工具请求（异步）
+        
+        各工具调用并发执行，结果按调用顺序返回
+        """
+        calls = params.calls
+        logger.info("处理批量执行工具请求，调用数: %d", len(calls))
         
-        tool_id = params["id"]
-        tool_params = params.get("params", {})
+        results = await asyncio.gather(
+            *(self._dispatch_one(call) for call in calls), return_exceptions=True
+        )
         
-        logger.info(f"处理执行工具请求，工具 ID: {tool_id}，参数: {tool_params}")
+        # 工具不存在等异常转换为错误结果
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                results[i] = {
+                    "id": calls[i].id,
+                    "status": "error",
+                    "error": str(result)
+                }
+        
+        return {
+            "results": results
+        }
+    
+    async def _dispatch_one(self, call: ExecuteToolParams) -> Dict[str, Any]:
+        """执行单个工具调用"""
+        tool_id = call.id
+        tool_params = call.params
+        
+        logger.info("处理执行工具请求，工具 ID: %s，参数: %s", tool_id, tool_params)
         
         # 查找工具
-        if tool_id not in self.tools:
+        entry = self._tool_handlers.get(tool_id)
+        if entry is None:
             raise ValueError(f"工具 ID '{tool_id}' 不存在")
         
-        tool = self.tools[tool_id]
-        handler = tool["handler"]
+        handler, is_coro = entry
         
         # 执行工具
         try:
-            if asyncio.iscoroutinefunction(handler):
+            if is_coro:
                 result = await handler(tool_params)
             else:
                 result = handler(tool_params)
@@ -131,7 +248,7 @@ class ToolRouter(MCPBaseRouter):
                 "result": result
             }
         except Exception as e:
-            logger.exception(f"执行工具 '{tool_id}' 时出错")
+            logger.exception("执行工具 '%s' 时出错", tool_id)
             return {
                 "id": tool_id,
                 "status": "error",
@@ -140,11 +257,11 @@ class ToolRouter(MCPBaseRouter):
     
     def handle_cancel_tool(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """处理取消工具执行请求"""
-        if not params or "id" not in params:
+        tool_id = params.get("id") if params else None
+        if tool_id is None:
             raise ValueError("缺少工具 ID 参数")
         
-        tool_id = params["id"]
-        logger.info(f"处理取消工具执行请求，工具 ID: {tool_id}")
+        logger.info("处理取消工具执行请求，工具 ID: %s", tool_id)
         
         # 在实际应用中，这里会取消正在执行的工具
         return {
@@ -158,20 +275,7 @@ class ToolRouter(MCPBaseRouter):
         scope = params.get("scope", "all")
         
         # 示例搜索结果
-        results = []
-        if scope in ["all", "code"]:
-            results.append({
-                "path": "/examples/example.py",
-                "snippet": "def hello_world():",
-                "relevance": 0.95
-            })
-        
-        if scope in ["all", "docs"]:
-            results.append({
-                "path": "/docs/example.md",
-                "snippet": "# 示例文档",
-                "relevance": 0.85
-            })
+        results = self._search_results.get(scope, ())
         
         return {
             "query": query,
@@ -187,41 +291,48 @@ class ToolRouter(MCPBaseRouter):
         if not action or not path:
             raise ValueError("缺少必要参数")
         
-        # 模拟异步操作
-        await asyncio.sleep(0.1)
+        fn = self._fs_dispatch.get(action)
+        if fn is None:
+            raise ValueError(f"不支持的操作: {action}")
         
-        # 示例实现
-        if action == "read":
-            # 模拟读取文件
-            content = "这是模拟的文件内容"
-            return {
-                "path": path,
-                "content": content,
-                "size": len(content)
-            }
-        elif action == "write":
-            # 模拟写入文件
-            content = params.get("content", "")
-            return {
-                "path": path,
-                "written": True,
-                "size": len(content)
-            }
-        elif action == "list":
-            # 模拟列出目录
-            return {
-                "path": path,
-                "items": [
-                    {"name": "file1.txt", "type": "file", "size": 1024},
-                    {"name": "file2.py", "type": "file", "size": 2048},
-                    {"name": "subdir", "type": "directory"}
-                ]
-            }
-        elif action == "delete":
-            # 模拟删除文件
-            return {
-                "path": path,
-                "deleted": True
-            }
-        else:
-            raise ValueError(f"不支持的操作: {action}")
\ No newline at end of file
+        # 模拟异步操作（仅在设置 MCP_SIM_LATENCY 时）
+        if self._sim_latency:
+            await asyncio.sleep(self._sim_latency)
+        
+        return fn(path, params)
+    
+    def _fs_read(self, path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """模拟读取文件"""
+        content = "这是模拟的文件内容"
+        return {
+            "path": path,
+            "content": content,
+            "size": len(content)
+        }
+    
+    def _fs_write(self, path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """模拟写入文件"""
+        content = params.get("content", "")
+        return {
+            "path": path,
+            "written": True,
+            "size": len(content)
+        }
+    
+    def _fs_list(self, path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """模拟列出目录"""
+        return {
+            "path": path,
+            "items": [
+                {"name": "file1.txt", "type": "file", "size": 1024},
+                {"name": "file2.py", "type": "file", "size": 2048},
+                {"name": "subdir", "type": "directory"}
+            ]
+        }
+    
+    def _fs_delete(self, path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """模拟删除文件"""
+        return {
+            "path": path,
+            "deleted": True
+        }